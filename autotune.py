@@ -0,0 +1,108 @@
+import argparse
+import os
+import statistics
+import time
+
+from llama_cpp import Llama
+
+from finalTask import draft_model_path, model_path
+from hostProfile import save_host_profile
+
+# Text repeated to build the benchmark prompt
+benchmark_text = "The capital of France is Paris. The leader of Germany is Olaf Scholz. "
+
+
+# Function to list the thread counts worth trying on this host
+def thread_candidates():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return sorted({n for n in (4, 8, 16, 32, cpus // 4, cpus // 2, cpus) if 1 <= n <= cpus})
+
+
+# Function to time one generation: prompt-eval and decode speed in tokens/s
+def time_generation(llm, tokens, decode_tokens):
+    # Forget the previous run, so the prompt is evaluated again instead of reused from the cache
+    llm.reset()
+    start = time.perf_counter()
+    first_token_at = None
+    generated = 0
+    # The first token is only produced once the whole prompt has been evaluated
+    for _ in llm.generate(tokens, top_k=1, temp=0.0, reset=True):
+        generated += 1
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        if generated >= decode_tokens:
+            break
+    end = time.perf_counter()
+    return (
+        len(tokens) / (first_token_at - start),
+        (generated - 1) / (end - first_token_at) if generated > 1 else 0.0,
+    )
+
+
+# Function to measure prompt-eval and decode speed (tokens/s) for one set of Llama settings
+def benchmark(path, settings, decode_tokens=32, runs=3):
+    llm = Llama(model_path=path, verbose=False, **settings)
+    prompt_tokens = min(256, llm.n_ctx() - decode_tokens - 8)
+    tokens = llm.tokenize(benchmark_text.encode("utf-8"))
+    tokens = (tokens * (prompt_tokens // len(tokens) + 1))[:prompt_tokens]
+
+    # Discarded warm-up: the first run also pays for paging the mmap'd model in from disk
+    time_generation(llm, tokens, decode_tokens)
+    timings = [time_generation(llm, tokens, decode_tokens) for _ in range(runs)]
+    del llm
+
+    return {
+        "prompt_tokens_per_s": statistics.median(prompt for prompt, _ in timings),
+        "decode_tokens_per_s": statistics.median(decode for _, decode in timings),
+    }
+
+
+# Function to estimate seconds per question for a workload of short prompts and short answers
+def question_seconds(measurement, prompt_tokens=32, answer_tokens=32):
+    if not measurement["prompt_tokens_per_s"] or not measurement["decode_tokens_per_s"]:
+        return float("inf")
+    return prompt_tokens / measurement["prompt_tokens_per_s"] + answer_tokens / measurement["decode_tokens_per_s"]
+
+
+# Function to tune one model, changing one setting at a time and keeping the fastest value
+def autotune_model(path):
+    threads = thread_candidates()
+    grid = [
+        ("n_threads", threads),
+        ("n_threads_batch", threads),
+        ("n_batch", [128, 256, 512]),
+        ("use_mlock", [False, True]),
+    ]
+    # n_ctx is left to each loader: it is a capacity limit, not a speed setting
+    best = {"n_threads": threads[-1], "n_threads_batch": threads[-1], "n_batch": 512,
+            "use_mmap": True, "use_mlock": False}
+    best_measurement = None
+    for name, values in grid:
+        for value in values:
+            settings = dict(best, **{name: value})
+            try:
+                measurement = benchmark(path, settings)
+            except Exception as e:
+                # e.g. use_mlock without permission to lock memory
+                print(f"  {name}={value}: failed ({e})")
+                continue
+            print(f"  {name}={value}: prompt {measurement['prompt_tokens_per_s']:.1f} tok/s, "
+                  f"decode {measurement['decode_tokens_per_s']:.1f} tok/s")
+            if best_measurement is None or question_seconds(measurement) < question_seconds(best_measurement):
+                best, best_measurement = settings, measurement
+    return best, best_measurement
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark llama.cpp settings on this host and save a profile")
+    parser.add_argument("models", nargs="*", default=[model_path, draft_model_path], help="GGUF model files")
+    args = parser.parse_args()
+
+    for path in args.models:
+        print(f"Tuning {path}. Please wait...")
+        settings, measurement = autotune_model(path)
+        if measurement is None:
+            print(f"No working settings found for {path}")
+            continue
+        profile_path = save_host_profile(path, settings, measurement)
+        print(f"Best settings for {path}: {settings} -> saved to {profile_path}")
@@ -0,0 +1,146 @@
+import argparse
+import multiprocessing
+import os
+import queue
+from multiprocessing import resource_tracker, shared_memory
+
+from spacy.tokens import DocBin
+
+from finalTask import extract_claim, nlp, process_question_and_answer
+from records import outcome_names, verdict_from_result
+from runJournal import default_corpus, load_corpus
+
+
+# Function to parse a batch of (question, answer) pairs and place the serialized Docs in a named shared memory block
+def parse_to_shared_memory(pairs, name):
+    texts = [text for pair in pairs for text in pair]
+    doc_bin = DocBin(docs=nlp.pipe(texts), store_user_data=False)
+    data = doc_bin.to_bytes()
+    block = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    block.buf[:len(data)] = data
+    # The consumer unlinks the block, so this process must not clean it up again when it exits
+    resource_tracker.unregister(block._name, "shared_memory")
+    block.close()
+    return block.name, len(data)
+
+
+# Function to rebuild the parsed (question, answer) Docs from a shared memory block, then free the block
+def docs_from_shared_memory(name, size):
+    block = shared_memory.SharedMemory(name=name)
+    buffer = block.buf[:size]
+    try:
+        # from_bytes decompresses straight from the shared buffer, without copying it first
+        docs = list(DocBin().from_bytes(buffer).get_docs(nlp.vocab))
+    finally:
+        buffer.release()
+        block.close()
+        block.unlink()
+    return list(zip(docs[0::2], docs[1::2]))
+
+
+# Function to free a block no verification worker consumed (e.g. because the worker died)
+def unlink_block(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    block.close()
+    block.unlink()
+    return True
+
+
+# Parse stage: turns batches of (id, question, answer) items into DocBin blocks for the verification stage
+def parse_stage(batches, names, blocks, num_workers):
+    try:
+        for batch, name in zip(batches, names):
+            name, size = parse_to_shared_memory([(question, answer) for _, question, answer in batch], name)
+            blocks.put(([qid for qid, _, _ in batch], name, size))
+    finally:
+        # Even when parsing fails, the verification workers must be told to stop
+        for _ in range(num_workers):
+            blocks.put(None)
+
+
+# Verification stage: rehydrates each block and verifies its pairs without parsing them again
+def verify_stage(blocks, results):
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            ids, name, size = block
+            for qid, (question, answer) in zip(ids, docs_from_shared_memory(name, size)):
+                result = process_question_and_answer(question, answer)
+                results.put(verdict_from_result(qid, extract_claim(question), answer.text, result))
+    finally:
+        # The parent counts these sentinels, so a worker that raised must still send its own
+        results.put(None)
+
+
+# Function to run parsing and verification in separate processes, passing Docs through shared memory
+def run_pipeline(items, num_workers, batch_size):
+    context = multiprocessing.get_context("fork")
+    blocks = context.Queue(maxsize=num_workers * 2)
+    results = context.Queue()
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    # Blocks are named after this process, so the ones left behind by a dead worker can be found and freed
+    names = [f"docbin-{os.getpid()}-{index}" for index in range(len(batches))]
+    parser = context.Process(target=parse_stage, args=(batches, names, blocks, num_workers))
+    verifiers = [context.Process(target=verify_stage, args=(blocks, results)) for _ in range(num_workers)]
+    for process in [parser] + verifiers:
+        process.start()
+
+    verdicts = []
+    finished = 0
+    stop_sent = 0
+    exited = set()
+    while finished < num_workers:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            # Workers that had exited before this second of silence have nothing left in the queue;
+            # if they all did, the ones that never sent a sentinel were killed
+            if len(exited) == num_workers:
+                print(f"{num_workers - finished} verification workers died without finishing")
+                break
+            # A killed parse stage never sent the sentinels, so send them in its place
+            if parser.exitcode not in (None, 0):
+                try:
+                    while stop_sent < num_workers:
+                        blocks.put_nowait(None)
+                        stop_sent += 1
+                except queue.Full:
+                    pass
+        else:
+            if result is None:
+                finished += 1
+            else:
+                verdicts.append(result)
+        exited = {index for index, process in enumerate(verifiers) if process.exitcode is not None}
+
+    for process in verifiers:
+        process.join()
+    # With no workers left to consume them, the parse stage may be stuck putting blocks in a full queue
+    if parser.is_alive():
+        parser.terminate()
+    parser.join()
+    # Blocks are not tracked by the resource tracker, so any that were never consumed must be unlinked here
+    leaked = sum(unlink_block(name) for name in names)
+    if leaked:
+        print(f"Freed {leaked} shared memory blocks that were never verified")
+    return verdicts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse in one process and verify in others, sharing Docs via DocBin")
+    parser.add_argument("corpus", nargs="?", help="JSON lines corpus with answers (defaults to the built-in questions)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    # Only questions that come with an answer can be verified without the model
+    corpus = [item for item in (load_corpus(args.corpus) if args.corpus else default_corpus()) if item[2] is not None]
+    questions = {qid: question for qid, question, _ in corpus}
+    for verdict in run_pipeline(corpus, args.workers, args.batch_size):
+        print(f"Question: {questions[verdict.question_id]} -> Answer: {verdict.answer} "
+              f"-> Result: {outcome_names[verdict.outcome]}")
@@ -1,11 +1,16 @@
 import requests
 import spacy
+from spacy.tokens import Doc
 from rapidfuzz import fuzz
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaGrammar
+from speculativeDecoding import SmallModelDraft
+from hostProfile import load_host_profile
 
 
 # Path to language model file
 model_path =  "models/llama-2-13b.Q4_K_M.gguf"
+# Smaller model used to draft tokens for the large one
+draft_model_path = "models/llama-2-7b.Q4_K_M.gguf"
 
 nlp = spacy.load("en_core_web_sm")
 
@@ -18,16 +23,91 @@ question_to_property_map = {
     "country": "P17",
 }
 
-def QueryModel(question):
+# Models already loaded in this process, keyed by path and load options
+_loaded_models = {}
+# Load options applied to every model on top of the host profile (see workerLauncher.py)
+model_overrides = {}
+
+# Function to load a model once and reuse it for every later query
+def load_model(path=model_path, **kwargs):
+    kwargs = {**model_overrides, **kwargs}
+    key = (path, tuple(sorted(kwargs.items())))
+    if key not in _loaded_models:
+        # Settings tuned for this host by autotune.py; explicit arguments take precedence
+        options = {**load_host_profile(path), **kwargs}
+        _loaded_models[key] = Llama(model_path=path, verbose=False, **options)
+    return _loaded_models[key]
+
+# Function to load the large model with the small one drafting tokens for it (speculative decoding)
+def load_speculative_model(num_pred_tokens=8):
+    key = ("speculative", num_pred_tokens)
+    if key not in _loaded_models:
+        draft = SmallModelDraft(load_model(draft_model_path), num_pred_tokens)
+        options = {**load_host_profile(model_path), **model_overrides}
+        _loaded_models[key] = Llama(model_path=model_path, verbose=False, draft_model=draft, **options)
+    return _loaded_models[key]
+
+# Function to classify the question type
+def classify_question(question):
+    if question.lower().startswith(("is", "does", "can", "are")):
+        return "yes_no"
+    if question.lower().startswith(("what", "who", "where")):
+        return "entity"
+    return "unknown"
+
+# llama.cpp grammars that only let the model emit the answer itself, per question type
+answer_grammars = {
+    "yes_no": r'''
+        root ::= " "? ("yes" | "no" | "Yes" | "No")
+    ''',
+    "entity": r'''
+        root ::= " "? word (" " word)? (" " word)? (" " word)?
+        word ::= [^ \t\n] [^ \t\n]*
+    ''',
+}
+# Token budget per question type when the answer is grammar constrained
+answer_max_tokens = {"yes_no": 2, "entity": 12}
+# Q/A frame with one worked example per question type, so the constrained tokens are the answer itself
+# rather than the start of a sentence like "The capital of France is Paris."
+answer_examples = {
+    "yes_no": "Q: Is Rome the capital of Italy? A: yes",
+    "entity": "Q: Who wrote Hamlet? A: William Shakespeare",
+}
+_loaded_grammars = {}
+
+# Function to get the answer grammar for a question, or None if its type is unknown
+def load_answer_grammar(question_type):
+    if question_type not in answer_grammars:
+        return None
+    if question_type not in _loaded_grammars:
+        _loaded_grammars[question_type] = LlamaGrammar.from_string(answer_grammars[question_type], verbose=False)
+    return _loaded_grammars[question_type]
+
+# Function to get the generation options for a question; answer_mode restricts output to the answer only
+def answer_options(question, answer_mode=False):
+    question_type = classify_question(question) if answer_mode else "unknown"
+    grammar = load_answer_grammar(question_type)
+    if grammar is None:
+        return {"max_tokens": 32}
+    return {"max_tokens": answer_max_tokens[question_type], "grammar": grammar}
+
+# Function to build the prompt for a question; answer_mode frames it so the model replies with the answer only
+def answer_prompt(question, answer_mode=False):
+    question_type = classify_question(question) if answer_mode else "unknown"
+    if question_type not in answer_examples:
+        return question
+    return f"{answer_examples[question_type]}\nQ: {question} A:"
+
+def QueryModel(question, speculative=False, answer_mode=False):
     # Display query
     print(f"Asking the question: \"{question}\" to the model. Please wait...")
-    llm = Llama(model_path=model_path, verbose=False)
+    llm = load_speculative_model() if speculative else load_model()
     # Query the model
     output = llm(
-        question,              # The input prompt/question
-        max_tokens=32,         # Limit the response to 32 tokens
+        answer_prompt(question, answer_mode),  # The input prompt/question, framed as Q/A in answer mode
         stop=["Q:", "\n"],     # Stop generation if a new question or line starts
-        echo=False             # Include the prompt in the output
+        echo=False,            # Include the prompt in the output
+        **answer_options(question, answer_mode)  # Token limit, and the answer grammar in answer mode
     )
     # Display the raw output (B)
     raw_text = output['choices'][0]['text'] if 'choices' in output and output['choices'] else ""
@@ -35,8 +115,12 @@ def QueryModel(question):
     print(raw_text)
     return raw_text
 
+# Function to parse text, reusing it when it is already a parsed Doc (see docBinTransfer.py)
+def as_doc(text):
+    return text if isinstance(text, Doc) else nlp(text)
+
 def extract_claim(question):
-    doc = nlp(question)
+    doc = as_doc(question)
     subject, predicate, obj = None, None, None
     entities = [ent.text for ent in doc.ents if ent.label_ in ["GPE", "LOC", "PERSON", "ORG"]]
     for token in doc:
@@ -47,36 +131,62 @@ def extract_claim(question):
     if entities:
         subject = entities[0]
     return subject, predicate, obj
+# Index of Wikipedia titles and redirects (see titleIndex.py); None builds URLs from the entity text
+title_index = None
+
 def extract_entities_with_urls(text):
-    doc = nlp(text)
+    doc = as_doc(text)
     entities = [ent.text for ent in doc.ents]
     output_lines = []
 
     for entity in entities:
-        # Format the Wikipedia URL (replace spaces with underscores for valid URLs)
-        wikipedia_url = f"https://en.wikipedia.org/wiki/{entity.replace(' ', '_')}"
+        # Use the canonical article when the index knows the title (or a redirect to it)
+        wikipedia_url = title_index.url(entity) if title_index is not None else None
+        if wikipedia_url is None:
+            # Format the Wikipedia URL (replace spaces with underscores for valid URLs)
+            wikipedia_url = f"https://en.wikipedia.org/wiki/{entity.replace(' ', '_')}"
         output_lines.append(f"{entity}\t{wikipedia_url}")
     
     if(entities):
         print("Entities extracted:\n" + "\n".join(output_lines))
     return "\n".join(output_lines)
 
+# Raised when Wikidata cannot be reached or answers with an HTTP error, unlike a lookup that finds nothing
+class WikidataUnavailable(Exception):
+    pass
+
+# Function to GET a Wikidata URL and decode its JSON, raising WikidataUnavailable on network or HTTP errors
+def wikidata_json(url, **kwargs):
+    try:
+        response = requests.get(url, **kwargs)
+        if response.status_code != 200:
+            raise WikidataUnavailable(f"{url} answered with HTTP {response.status_code}")
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise WikidataUnavailable(str(e)) from e
+
 def query_wikidata_entity(entity_name):
     url = f"https://www.wikidata.org/w/api.php?action=wbsearchentities&search={entity_name}&language=en&format=json"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        if 'search' in data and len(data['search']) > 0:
-            entity_id = data['search'][0]['id']
-            return entity_id
+    data = wikidata_json(url)
+    if 'search' in data and len(data['search']) > 0:
+        entity_id = data['search'][0]['id']
+        return entity_id
     return None
+# Cache of Wikidata facts (see wikidataCache.py); None queries Wikidata every time
+wikidata_cache = None
+
 def query_wikidata_relationship(subject, predicate):
+    if wikidata_cache is not None:
+        return wikidata_cache.lookup(subject, predicate)
     subject_id = query_wikidata_entity(subject)
     if not subject_id:
         return None
     property_id = question_to_property_map.get(predicate)
     if not property_id:
         return None
+    return query_wikidata_property(subject_id, property_id)
+
+def query_wikidata_property(subject_id, property_id):
     query = f"""
     SELECT ?objectLabel WHERE {{
       wd:{subject_id} wdt:{property_id} ?object.
@@ -85,25 +195,20 @@ def query_wikidata_relationship(subject, predicate):
     """
     url = "https://query.wikidata.org/sparql"
     headers = {"Accept": "application/json"}
-    response = requests.get(url, headers=headers, params={"query": query})
-    if response.status_code == 200:
-        data = response.json()
-        objects = [item["objectLabel"]["value"] for item in data["results"]["bindings"]]
-        return objects
-    return None
+    data = wikidata_json(url, headers=headers, params={"query": query})
+    objects = [item["objectLabel"]["value"] for item in data["results"]["bindings"]]
+    return objects
 def query_wikidata_question(subject, predicate):
     if predicate not in question_to_property_map:
         return None  # Unsupported predicate
+    if wikidata_cache is not None:
+        return wikidata_cache.lookup(subject, predicate)
 
     predicate_id = question_to_property_map[predicate]
     
     # Query Wikidata for the subject
     url = f"https://www.wikidata.org/w/api.php?action=wbsearchentities&search={subject}&language=en&format=json"
-    response = requests.get(url)
-    if response.status_code != 200:
-        return None
-
-    data = response.json()
+    data = wikidata_json(url)
     if not data['search']:
         return None  # Subject not found
     
@@ -117,16 +222,13 @@ def query_wikidata_question(subject, predicate):
     }}
     """
     sparql_url = "https://query.wikidata.org/sparql"
-    sparql_response = requests.get(sparql_url, params={"query": sparql_query, "format": "json"})
-    
-    if sparql_response.status_code != 200:
-        return None
-
-    sparql_data = sparql_response.json()
+    sparql_data = wikidata_json(sparql_url, params={"query": sparql_query, "format": "json"})
     objects = [binding['objectLabel']['value'] for binding in sparql_data['results']['bindings']]
     return objects
 
 def process_question_and_answer(question, answer):
+    # Parse each text once; every step below reuses the parsed Doc
+    question, answer = as_doc(question), as_doc(answer)
     extract_entities_with_urls(question)
     extract_entities_with_urls(answer)
     subject, predicate, obj = extract_claim(question)
@@ -143,16 +245,20 @@ def process_question_and_answer(question, answer):
 def normalize_answer(answer):
     yes_variants = ["yes", "yeah", "yep", "sure", "correct", "affirmative"]
     no_variants = ["no", "nope", "nah", "incorrect", "negative"]
-    answer_lower = answer.lower()
+    answer_text = answer.text if isinstance(answer, Doc) else answer
+    answer_lower = answer_text.lower()
     if any(variant in answer_lower for variant in yes_variants):
         return "yes"
     if any(variant in answer_lower for variant in no_variants):
         return "no"
-    doc = nlp(answer)
+    doc = as_doc(answer)
     entities = [ent.text for ent in doc.ents]
     if entities:
         return entities[0]
-    return answer.strip()
+    return answer_text.strip()
+
+# Embedding matcher used when fuzzy matching fails (see semanticMatcher.py); None disables it
+semantic_matcher = None
 
 def check_statement(statement, processed_answer):
     subject, predicate, obj = extract_claim(statement)
@@ -161,11 +267,16 @@ def check_statement(statement, processed_answer):
         return "Could not parse the statement properly."
 
     # Query Wikidata for the relationship
-    valid_objects = query_wikidata_question(subject, predicate)
+    try:
+        valid_objects = query_wikidata_question(subject, predicate)
+    except WikidataUnavailable:
+        return f"Could not reach Wikidata to verify the statement: {statement}"
 
     if valid_objects is None:
         return f"Could not verify the statement: {statement}"
     match_found = any(fuzz.ratio(obj.lower(), valid_obj.lower()) > 85 for valid_obj in valid_objects)
+    if not match_found and semantic_matcher is not None:
+        match_found = semantic_matcher.matches(obj, valid_objects)
     expected_truth = processed_answer.lower() == "yes"
 
     if match_found == expected_truth:
@@ -173,11 +284,16 @@ def check_statement(statement, processed_answer):
     else:
         return "incorrect"
 def verify_answer(subject, predicate, answer):
-        valid_objects = query_wikidata_relationship(subject, predicate)
+        try:
+            valid_objects = query_wikidata_relationship(subject, predicate)
+        except WikidataUnavailable:
+            return f"Could not reach Wikidata to verify the statement about {subject}."
         if valid_objects is None:
             return f"Could not verify the statement about {subject}."
 
         match_found = any(fuzz.ratio(answer.lower(), obj.lower()) > 85 for obj in valid_objects)
+        if not match_found and semantic_matcher is not None:
+            match_found = semantic_matcher.matches(answer, valid_objects)
         if match_found:
             return "correct"
         else:
@@ -198,12 +314,13 @@ questions_and_answers = [
     ("Who is the leader of Germany?", "It is Fritz Fritzgerald"),
 ]
 
-#* Can be commented out to just run the auto-tests*#
-result = process_question_and_answer("What is the capital of France?" ,QueryModel("What is the capital of France?"))
-print(f"Question: What is the capital of France? -> Paris -> Result: {result}")
-print("*--------------*-------------*--------------*")
-
-for question, answer in questions_and_answers:
-    result = process_question_and_answer(question, answer)
-    print(f"Question: {question} -> Answer: {answer} -> Result: {result}")
+if __name__ == "__main__":
+    #* Can be commented out to just run the auto-tests*#
+    result = process_question_and_answer("What is the capital of France?" ,QueryModel("What is the capital of France?"))
+    print(f"Question: What is the capital of France? -> Paris -> Result: {result}")
     print("*--------------*-------------*--------------*")
+
+    for question, answer in questions_and_answers:
+        result = process_question_and_answer(question, answer)
+        print(f"Question: {question} -> Answer: {answer} -> Result: {result}")
+        print("*--------------*-------------*--------------*")
@@ -0,0 +1,38 @@
+import json
+import os
+import socket
+
+# Directory with one tuning profile per host, written by autotune.py. It sits next to this module, so the
+# profile is found whatever directory a script is started from; HOST_PROFILE_DIR overrides it
+profile_dir = os.environ.get("HOST_PROFILE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+
+# Function to get the profile file for a host (this machine by default)
+def host_profile_path(host=None):
+    return os.path.join(profile_dir, f"{host or socket.gethostname()}.json")
+
+
+# Function to read every model's settings from this host's profile
+def read_host_profile(path=None):
+    path = path or host_profile_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Function to get the tuned Llama settings for a model on this host ({} if it was never tuned)
+def load_host_profile(model_path):
+    # Profiles are keyed by file name so they work wherever the models directory lives
+    return read_host_profile().get(os.path.basename(model_path), {}).get("settings", {})
+
+
+# Function to store the tuned settings (and the measurements behind them) for a model on this host
+def save_host_profile(model_path, settings, measurements=None):
+    path = host_profile_path()
+    profile = read_host_profile(path)
+    profile[os.path.basename(model_path)] = {"settings": settings, "measurements": measurements or {}}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+    return path
@@ -1,10 +1,11 @@
 from llama_cpp import Llama
+from hostProfile import load_host_profile
 
 # Path to language model file
 model_path = "models/llama-2-7b.Q4_K_M.gguf"
 
 # Initialize language model
-llm = Llama(model_path=model_path, verbose=False)
+llm = Llama(model_path=model_path, verbose=False, **load_host_profile(model_path))
 
 # Define question
 question = "What is the capital of Italy? "
@@ -0,0 +1,83 @@
+import argparse
+
+from finalTask import (
+    QueryModel,
+    answer_options,
+    answer_prompt,
+    draft_model_path,
+    load_model,
+    model_path,
+    normalize_answer,
+    process_question_and_answer,
+    questions_and_answers,
+)
+
+# Verdict returned when the question itself cannot be parsed; asking a bigger model does not help
+QUESTION_PARSE_FAILURE = "Could not parse the question properly."
+# Verdicts that only depend on the question's claim and its Wikidata lookup, so they do not help either
+QUESTION_ONLY_VERDICTS = (
+    "Could not parse the statement properly.",
+    "Could not verify the statement",
+    "Could not reach Wikidata",
+)
+
+
+# Function to ask a model and get its answer with the mean log-probability of the answer tokens
+def ask_with_logprob(llm, question, answer_mode=False):
+    output = llm(
+        answer_prompt(question, answer_mode),  # The input prompt/question, framed as Q/A in answer mode
+        stop=["Q:", "\n"],     # Stop generation if a new question or line starts
+        echo=False,            # Do not include the prompt in the output
+        logprobs=1,            # Return the log-probability of each generated token
+        **answer_options(question, answer_mode)  # Token limit, and the answer grammar in answer mode
+    )
+    choice = output['choices'][0] if 'choices' in output and output['choices'] else None
+    if choice is None:
+        return "", float("-inf")
+    token_logprobs = [lp for lp in (choice.get('logprobs') or {}).get('token_logprobs', []) if lp is not None]
+    mean_logprob = sum(token_logprobs) / len(token_logprobs) if token_logprobs else float("-inf")
+    return choice['text'], mean_logprob
+
+
+# Function to list why a small-model answer should be re-asked to the large model
+def escalation_reasons(raw_text, mean_logprob, verdict, min_logprob):
+    reasons = []
+    if not raw_text.strip() or not normalize_answer(raw_text):
+        reasons.append("unparseable answer")
+    if mean_logprob < min_logprob:
+        reasons.append(f"low probability ({mean_logprob:.2f})")
+    if verdict not in ("correct", QUESTION_PARSE_FAILURE) and not verdict.startswith(QUESTION_ONLY_VERDICTS):
+        reasons.append(f"verification: {verdict}")
+    return reasons
+
+
+# Function to answer with the small model first and only ask the large model when needed
+def answer_with_cascade(question, min_logprob=-1.0, answer_mode=False):
+    print(f"Asking the question: \"{question}\" to the small model. Please wait...")
+    # logprobs need the logits of every token, so the cascade keeps its own small model instance
+    small_llm = load_model(draft_model_path, logits_all=True)
+    raw_text, mean_logprob = ask_with_logprob(small_llm, question, answer_mode)
+    verdict = process_question_and_answer(question, raw_text)
+
+    reasons = escalation_reasons(raw_text, mean_logprob, verdict, min_logprob)
+    if not reasons:
+        return {"answer": raw_text, "result": verdict, "model": draft_model_path, "escalated": []}
+
+    print(f"Escalating to the large model: {', '.join(reasons)}")
+    # The large model's answer is final, so it needs no logprobs: QueryModel shares the plain load_model() instance
+    raw_text = QueryModel(question, answer_mode=answer_mode)
+    verdict = process_question_and_answer(question, raw_text)
+    return {"answer": raw_text, "result": verdict, "model": model_path, "escalated": reasons}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer questions with a small-then-large model cascade")
+    parser.add_argument("--min-logprob", type=float, default=-1.0,
+                        help="mean token log-probability below which the large model is asked")
+    parser.add_argument("--answer-mode", action="store_true", help="constrain answers with a grammar per question type")
+    args = parser.parse_args()
+
+    for question in dict.fromkeys(question for question, _ in questions_and_answers):
+        cascade = answer_with_cascade(question, args.min_logprob, args.answer_mode)
+        print(f"Question: {question} -> Answer: {cascade['answer']} -> Result: {cascade['result']} ({cascade['model']})")
+        print("*--------------*-------------*--------------*")
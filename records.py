@@ -0,0 +1,220 @@
+import argparse
+import sqlite3
+import sys
+
+import numpy as np
+
+import finalTask
+from finalTask import query_wikidata_entity, question_to_property_map
+
+# Verdict outcomes, stored as small integers instead of the pipeline's result strings
+CORRECT = 0
+INCORRECT = 1
+QUESTION_NOT_PARSED = 2
+ANSWER_NOT_PROCESSED = 3
+STATEMENT_NOT_PARSED = 4
+NOT_VERIFIED = 5
+LOOKUP_FAILED = 6
+outcome_names = ["correct", "incorrect", "question not parsed", "answer not processed",
+                 "statement not parsed", "not verified", "lookup failed"]
+
+# Missing entity or property ids
+NO_ID = 0
+
+
+# Function to turn a Wikidata id like "Q42" or "P36" into its number (0 when there is none)
+def intern_id(wikidata_id):
+    return int(wikidata_id[1:]) if wikidata_id else NO_ID
+
+
+# Function to turn an interned number back into a Wikidata id
+def entity_id(number):
+    return f"Q{number}" if number else None
+
+
+def property_id(number):
+    return f"P{number}" if number else None
+
+
+# Function to map a result returned by process_question_and_answer to an outcome code
+def outcome_code(result):
+    result = str(result)
+    if result == "correct":
+        return CORRECT
+    if result == "incorrect":
+        return INCORRECT
+    if result == "Could not parse the question properly.":
+        return QUESTION_NOT_PARSED
+    if result == "Could not process the answer.":
+        return ANSWER_NOT_PROCESSED
+    if result == "Could not parse the statement properly.":
+        return STATEMENT_NOT_PARSED
+    # verify_answer and check_statement, when Wikidata has no answer
+    if result.startswith(("Could not verify the statement about ", "Could not verify the statement: ")):
+        return NOT_VERIFIED
+    # The same two, when Wikidata could not be reached
+    if result.startswith(("Could not reach Wikidata to verify the statement about ",
+                          "Could not reach Wikidata to verify the statement: ")):
+        return LOOKUP_FAILED
+    raise ValueError(f"unknown verdict: {result!r}")
+
+
+class Claim:
+    __slots__ = ("subject", "property_id", "obj")
+
+    def __init__(self, subject, predicate, obj):
+        # Claims repeat the same few subjects, so their text is shared
+        self.subject = sys.intern(subject) if subject else None
+        self.property_id = intern_id(question_to_property_map.get(predicate))
+        self.obj = obj
+
+    def __repr__(self):
+        return f"Claim({self.subject!r}, {property_id(self.property_id)}, {self.obj!r})"
+
+
+class ResolvedEntity:
+    __slots__ = ("text", "entity_id")
+
+    def __init__(self, text, entity_id):
+        self.text = sys.intern(text)
+        self.entity_id = entity_id
+
+    def __repr__(self):
+        return f"ResolvedEntity({self.text!r}, {entity_id(self.entity_id)})"
+
+
+class Verdict:
+    __slots__ = ("question_id", "claim", "subject", "answer", "outcome")
+
+    def __init__(self, question_id, claim, subject, answer, outcome):
+        self.question_id = question_id
+        self.claim = claim
+        self.subject = subject
+        self.answer = answer
+        self.outcome = outcome
+
+    def __repr__(self):
+        return f"Verdict({self.question_id!r}, {self.claim!r}, {outcome_names[self.outcome]!r})"
+
+
+# Function to resolve a subject to its entity, through the Wikidata cache when it is enabled
+def resolve_entity(text):
+    if not text:
+        return ResolvedEntity("", NO_ID)
+    if finalTask.wikidata_cache is not None:
+        found = finalTask.wikidata_cache.entity_id(text)
+    else:
+        found = query_wikidata_entity(text)
+    return ResolvedEntity(text, intern_id(found))
+
+
+# Function to build the Verdict record of one pipeline result, from the claim extract_claim found in the question
+def verdict_from_result(qid, claim, model_output, result):
+    subject, predicate, obj = claim
+    return Verdict(str(qid), Claim(subject, predicate, obj), ResolvedEntity(subject or "", NO_ID),
+                   model_output, outcome_code(result))
+
+
+# Function to build Verdict records from (question_id, model output, subject, predicate, object, result) rows
+def verdicts_from_rows(rows, resolve=False):
+    resolved = {}
+    verdicts = []
+    for qid, model_output, subject, predicate, obj, result in rows:
+        if resolve and subject not in resolved:
+            resolved[subject] = resolve_entity(subject)
+        subject_entity = resolved.get(subject) or ResolvedEntity(subject or "", NO_ID)
+        verdicts.append(Verdict(qid, Claim(subject, predicate, obj), subject_entity, model_output, outcome_code(result)))
+    return verdicts
+
+
+# Function to read Verdict records from a run journal written by runJournal.py
+def verdicts_from_journal(journal_path, resolve=False):
+    conn = sqlite3.connect(journal_path)
+    rows = conn.execute(
+        "SELECT question_id, model_output, subject, predicate, object, verdict FROM completed ORDER BY finished_at"
+    ).fetchall()
+    conn.close()
+    return verdicts_from_rows(rows, resolve)
+
+
+# Function to store text columns as integer codes into one table of distinct strings
+def encode_strings(values, strings, codes):
+    encoded = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        value = value or ""
+        if value not in codes:
+            codes[value] = len(strings)
+            strings.append(value)
+        encoded[i] = codes[value]
+    return encoded
+
+
+# Function to lay verdicts out column by column: a structured array plus the string table it refers to
+def to_columns(verdicts):
+    strings, codes = [], {}
+    columns = np.zeros(len(verdicts), dtype=[
+        ("question_id", np.int32),
+        ("subject", np.int32),
+        ("subject_id", np.int64),
+        ("property_id", np.int32),
+        ("object", np.int32),
+        ("answer", np.int32),
+        ("outcome", np.int8),
+    ])
+    columns["question_id"] = encode_strings([v.question_id for v in verdicts], strings, codes)
+    columns["subject"] = encode_strings([v.claim.subject for v in verdicts], strings, codes)
+    columns["subject_id"] = [v.subject.entity_id for v in verdicts]
+    columns["property_id"] = [v.claim.property_id for v in verdicts]
+    columns["object"] = encode_strings([v.claim.obj for v in verdicts], strings, codes)
+    columns["answer"] = encode_strings([v.answer for v in verdicts], strings, codes)
+    columns["outcome"] = [v.outcome for v in verdicts]
+    return columns, strings
+
+
+# Function to pack a string table as one UTF-8 buffer plus the offset where each string starts (and the
+# end of the last one), instead of a fixed-width array as wide as the longest string
+def pack_strings(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data, offsets):
+    data = data.tobytes()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+# Function to read verdict columns and their string table back from an .npz export
+def load_verdict_columns(path):
+    with np.load(path) as archive:
+        return archive["verdicts"], unpack_strings(archive["string_data"], archive["string_offsets"])
+
+
+# Function to write verdicts as .npz (NumPy) or, when pyarrow is installed, .parquet
+def export_verdicts(verdicts, output_path):
+    columns, strings = to_columns(verdicts)
+    if output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({
+            name: (pa.DictionaryArray.from_arrays(columns[name], pa.array(strings, pa.string()))
+                   if name in ("question_id", "subject", "object", "answer") else columns[name])
+            for name in columns.dtype.names
+        })
+        pq.write_table(table, output_path)
+    else:
+        string_data, string_offsets = pack_strings(strings)
+        np.savez_compressed(output_path, verdicts=columns, string_data=string_data, string_offsets=string_offsets)
+    return len(verdicts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a run journal as compact columnar verdict records")
+    parser.add_argument("journal", help="SQLite journal written by runJournal.py")
+    parser.add_argument("output", help=".npz or .parquet file")
+    parser.add_argument("--resolve", action="store_true", help="look up the Wikidata id of each subject")
+    args = parser.parse_args()
+
+    count = export_verdicts(verdicts_from_journal(args.journal, args.resolve), args.output)
+    print(f"Exported {count} verdicts to {args.output}")
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+
+from finalTask import (
+    QueryModel,
+    as_doc,
+    extract_claim,
+    process_question_and_answer,
+    questions_and_answers,
+)
+from records import verdict_from_result
+from semanticMatcher import enable_semantic_matcher
+from titleIndex import enable_title_index
+from wikidataCache import enable_cache
+
+
+# Function to open (or create) the run journal
+def open_journal(journal_path):
+    conn = sqlite3.connect(journal_path)
+    # WAL keeps appends cheap and lets another process read progress while we run
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS completed (
+            question_id TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            model_output TEXT,
+            subject TEXT,
+            predicate TEXT,
+            object TEXT,
+            verdict TEXT,
+            finished_at REAL NOT NULL
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+# Function to build a stable id for a question, so a restarted run recognises it
+def question_id(question, answer=None):
+    key = question if answer is None else f"{question}\t{answer}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+# Function to get the ids of every question already finished in the journal
+def load_completed(conn):
+    return {qid for qid, verdict in conn.execute("SELECT question_id, verdict FROM completed")
+            if not is_retryable(verdict)}
+
+
+# Function to get the journaled model output of every question whose Wikidata lookup must be retried
+def load_pending_lookups(conn):
+    return {qid: model_output for qid, model_output, verdict in conn.execute(
+        "SELECT question_id, model_output, verdict FROM completed"
+    ) if is_retryable(verdict)}
+
+
+# Function to append one finished question to the journal
+def record_result(conn, qid, question, model_output, claim, verdict):
+    subject, predicate, obj = claim
+    conn.execute(
+        "INSERT OR REPLACE INTO completed VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (qid, question, model_output, subject, predicate, obj, str(verdict), time.time()),
+    )
+    conn.commit()
+
+
+# Function to read a corpus of questions (JSON lines with "question" and optional "answer"/"id")
+def load_corpus(corpus_path):
+    items = []
+    with open(corpus_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            question = record["question"]
+            answer = record.get("answer")
+            # The journal stores ids as text, so integer ids must be compared as text too
+            qid = record.get("id")
+            items.append((str(qid) if qid is not None else question_id(question, answer), question, answer))
+    return items
+
+
+# Function to get the built-in questions as (id, question, answer) items
+def default_corpus():
+    return [(question_id(question, answer), question, answer) for question, answer in questions_and_answers]
+
+
+# Function to add the command line options that switch on the Wikidata cache, semantic matching and title index
+def add_lookup_arguments(parser):
+    parser.add_argument("--wikidata-cache", help="SQLite file caching Wikidata facts between runs")
+    parser.add_argument("--semantic-index", help="label index directory built by semanticMatcher.py")
+    parser.add_argument("--title-index", help="Wikipedia title index path prefix built by titleIndex.py")
+
+
+# Function to switch on the lookups requested by add_lookup_arguments options
+def enable_lookups(args):
+    if args.wikidata_cache:
+        enable_cache(args.wikidata_cache)
+    if args.semantic_index:
+        enable_semantic_matcher(args.semantic_index)
+    if args.title_index:
+        enable_title_index(args.title_index)
+
+
+# Function to tell whether a verdict comes from Wikidata being unreachable, so a later run may succeed.
+# Lookups that simply found nothing are final.
+def is_retryable(verdict):
+    return str(verdict).startswith("Could not reach Wikidata")
+
+
+# Function to run a list of (id, question, answer) items, skipping the ones already journaled
+def run_with_journal(items, journal_path):
+    conn = open_journal(journal_path)
+    completed = load_completed(conn)
+    pending = load_pending_lookups(conn)
+    print(f"Journal {journal_path}: {len(completed)} questions already done, "
+          f"{len(pending)} waiting for Wikidata, {len(items)} in corpus")
+    results = []
+    try:
+        for qid, question, answer in items:
+            if qid in completed:
+                continue
+            if qid in pending:
+                # Only the lookup failed last time; reuse the journaled output instead of generating again
+                model_output = pending[qid]
+            elif answer is not None:
+                model_output = answer
+            else:
+                # Questions without a given answer are asked to the model
+                model_output = QueryModel(question)
+            # Parsed once for both the claim and the verification
+            question_doc = as_doc(question)
+            claim = extract_claim(question_doc)
+            verdict = process_question_and_answer(question_doc, model_output)
+            results.append(verdict_from_result(qid, claim, model_output, verdict))
+            print(f"Question: {question} -> Answer: {model_output} -> Result: {verdict}")
+            record_result(conn, qid, question, model_output, claim, verdict)
+            if not is_retryable(verdict):
+                completed.add(qid)
+    finally:
+        conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable bulk verification run")
+    parser.add_argument("journal", help="SQLite file recording finished questions")
+    parser.add_argument("corpus", nargs="?", help="JSON lines corpus (defaults to the built-in questions)")
+    add_lookup_arguments(parser)
+    args = parser.parse_args()
+
+    enable_lookups(args)
+    corpus = load_corpus(args.corpus) if args.corpus else default_corpus()
+    run_with_journal(corpus, args.journal)
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import requests
+from rapidfuzz import fuzz
+
+import finalTask
+from finalTask import draft_model_path, load_model
+
+# Number of texts sent to the embedding model at once
+EMBED_BATCH_SIZE = 64
+# wbgetentities accepts at most 50 ids per request
+LABEL_BATCH_SIZE = 50
+
+
+# Function to embed texts with llama.cpp, returning one unit-length row per text
+def embed_texts(texts, embedding_model_path=draft_model_path):
+    llm = load_model(embedding_model_path, embedding=True)
+    rows = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        for embedding in llm.embed(texts[start:start + EMBED_BATCH_SIZE]):
+            vector = np.asarray(embedding, dtype=np.float32)
+            # Models without a pooling layer return one vector per token; average them
+            if vector.ndim == 2:
+                vector = vector.mean(axis=0)
+            rows.append(vector)
+    vectors = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Function to get the English label and aliases of entities from Wikidata, as (qid, label, aliases) rows
+def fetch_labels(entity_ids):
+    entity_ids = list(entity_ids)
+    rows = []
+    for start in range(0, len(entity_ids), LABEL_BATCH_SIZE):
+        response = requests.get("https://www.wikidata.org/w/api.php", params={
+            "action": "wbgetentities",
+            "ids": "|".join(entity_ids[start:start + LABEL_BATCH_SIZE]),
+            "props": "labels|aliases",
+            "languages": "en",
+            "format": "json",
+        })
+        if response.status_code != 200:
+            continue
+        for entity_id, entity in response.json().get("entities", {}).items():
+            label = entity.get("labels", {}).get("en", {}).get("value")
+            if label:
+                aliases = [alias["value"] for alias in entity.get("aliases", {}).get("en", [])]
+                rows.append((entity_id, label, aliases))
+    return rows
+
+
+# Function to read (qid, label, aliases) rows from "qid<TAB>label<TAB>alias|alias" lines
+def read_labels(labels_path):
+    rows = []
+    with open(labels_path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 2 and parts[1]:
+                aliases = [alias for alias in parts[2].split("|") if alias] if len(parts) > 2 else []
+                rows.append((parts[0], parts[1], aliases))
+    return rows
+
+
+# Function to group unit vectors into n_lists clusters (spherical k-means) for the inverted file index
+def train_centroids(vectors, n_lists, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignment == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[i] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+
+# Function to pick the similarity above which two texts count as the same thing: a high quantile
+# of the similarity between labels of different entities, since mean-pooled embeddings of
+# unrelated short strings are already quite similar
+def calibrate_threshold(vectors, entity_ids, quantile=0.995, samples=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    first = rng.integers(len(vectors), size=samples)
+    second = rng.integers(len(vectors), size=samples)
+    different = np.asarray(entity_ids)[first] != np.asarray(entity_ids)[second]
+    similarities = np.sum(vectors[first[different]] * vectors[second[different]], axis=1)
+    return float(np.quantile(similarities, quantile)) if len(similarities) else 1.0
+
+
+# Function to embed every label and alias once and save them as an IVF index in index_dir
+def build_label_index(rows, index_dir, n_lists=None):
+    texts, owners = [], []
+    for entity_id, label, aliases in rows:
+        for text in dict.fromkeys([label] + aliases):
+            texts.append(text)
+            owners.append((entity_id, label))
+    if not texts:
+        raise ValueError("no labels to index")
+
+    vectors = embed_texts(texts)
+    n_lists = n_lists or max(1, int(np.sqrt(len(texts))))
+    centroids = train_centroids(vectors, min(n_lists, len(texts)))
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+
+    # Store vectors grouped by cluster so each cluster is one contiguous slice
+    order = np.argsort(assignment, kind="stable")
+    list_offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "vectors.npy"), vectors[order])
+    np.save(os.path.join(index_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(index_dir, "list_offsets.npy"), list_offsets)
+    with open(os.path.join(index_dir, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump([[texts[i], owners[i][0], owners[i][1]] for i in order], f)
+    threshold = calibrate_threshold(vectors, [entity_id for entity_id, _ in owners])
+    with open(os.path.join(index_dir, "threshold.json"), "w", encoding="utf-8") as f:
+        json.dump({"threshold": threshold}, f)
+    return len(texts)
+
+
+# Matches answers to Wikidata labels by resolving them to their nearest indexed entity, using an index
+# built by build_label_index. The index should cover the plausible wrong answers too (e.g. every city
+# for capitals): an answer is only resolved to an entity that is clearly nearer than any other
+class SemanticMatcher:
+    def __init__(self, index_dir, nprobe=8, threshold=None, margin=0.05, top_k=10, max_cached=100000):
+        # The label vectors are memory-mapped, so only the rows that are used are read
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+        self.list_offsets = np.load(os.path.join(index_dir, "list_offsets.npy"))
+        with open(os.path.join(index_dir, "labels.json"), encoding="utf-8") as f:
+            self.labels = json.load(f)
+        if threshold is None:
+            with open(os.path.join(index_dir, "threshold.json"), encoding="utf-8") as f:
+                threshold = json.load(f)["threshold"]
+        self.nprobe = min(nprobe, len(self.centroids))
+        self.threshold = threshold
+        self.margin = margin
+        self.top_k = top_k
+        # Entity labels each indexed label or alias belongs to
+        self.owners = {}
+        for text, _, label in self.labels:
+            self.owners.setdefault(text.casefold(), set()).add(label)
+        # Entity labels already resolved for texts that are not in the index, oldest first
+        self.resolved = {}
+        self.max_cached = max_cached
+        # The embedding model must not be called from several threads at once
+        self.lock = threading.Lock()
+
+    # Function to find the nearest labels of many texts with one embedding call, as ([text, qid, label], score) lists
+    def search(self, texts):
+        queries = embed_texts(texts)
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.nprobe]
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+            scores = self.vectors[rows] @ query
+            best = np.argsort(-scores)[:self.top_k]
+            results.append([(self.labels[rows[i]], float(scores[i])) for i in best])
+        return results
+
+    # Function to get the entity label search hits point to: none when the nearest entity is below the
+    # threshold, or when another entity is within margin of it (e.g. an unindexed "Munich" near "Berlin")
+    def resolve(self, hits):
+        nearest = {}
+        for (_, entity_id, label), score in hits:
+            nearest.setdefault(entity_id, (score, label))
+        ranked = sorted(nearest.values(), reverse=True)
+        if not ranked or ranked[0][0] < self.threshold:
+            return set()
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < self.margin:
+            return set()
+        return {ranked[0][1]}
+
+    # Function to resolve many texts to entity labels, embedding and searching the new ones in one batch
+    def prefetch(self, texts):
+        texts = list(dict.fromkeys(texts))
+        with self.lock:
+            missing = [text for text in texts if text.casefold() not in self.owners and text not in self.resolved]
+            if missing:
+                for text, hits in zip(missing, self.search(missing)):
+                    self.resolved[text] = self.resolve(hits)
+            found = {text: self.owners.get(text.casefold()) or self.resolved[text] for text in texts}
+            while len(self.resolved) > self.max_cached:
+                del self.resolved[next(iter(self.resolved))]
+        return found
+
+    # Function to check whether an answer means one of the valid objects, e.g. "a physicist" -> "physicist".
+    # An indexed label or alias needs no embedding: "City of Light" is Paris, while "Berlin" is a
+    # different entity however close its embedding is to "Paris"
+    def matches(self, answer, valid_objects):
+        if not valid_objects:
+            return False
+        answer = answer.strip()
+        labels = self.prefetch([answer])[answer]
+        return any(fuzz.ratio(label.lower(), valid_obj.lower()) > 85
+                   for label in labels for valid_obj in valid_objects)
+
+
+# Function to make finalTask fall back to semantic matching when fuzzy matching fails
+def enable_semantic_matcher(index_dir, **kwargs):
+    finalTask.semantic_matcher = SemanticMatcher(index_dir, **kwargs)
+    return finalTask.semantic_matcher
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed Wikidata labels and aliases into an on-disk ANN index")
+    parser.add_argument("index", help="output directory")
+    parser.add_argument("--labels", help="qid<TAB>label<TAB>alias|alias file")
+    parser.add_argument("--entities", nargs="*", default=[], help="entity ids to fetch labels for from Wikidata")
+    parser.add_argument("--lists", type=int, help="number of clusters (default sqrt of the label count)")
+    args = parser.parse_args()
+
+    rows = read_labels(args.labels) if args.labels else []
+    rows += fetch_labels(args.entities)
+    count = build_label_index(rows, args.index, args.lists)
+    print(f"Indexed {count} labels and aliases into {args.index}")
@@ -0,0 +1,193 @@
+import argparse
+import glob
+import json
+import os
+import socket
+import time
+
+from finalTask import QueryModel, process_question_and_answer
+from runJournal import add_lookup_arguments, default_corpus, enable_lookups, load_corpus
+
+# A lease file moves from pending/ to claimed/ to done/; each worker writes the results of a lease
+# to its own file in results/, so no two nodes ever write to the same file
+QUEUE_DIRS = ("pending", "claimed", "done", "results")
+
+
+# Function to open (or create) the work queue: a directory on storage shared by every node. Leases are
+# claimed by renaming their file, which is atomic on a local disk and on NFS alike, so no locks are needed
+def open_queue(queue_dir):
+    for name in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+    return queue_dir
+
+
+# Function to write a file that other nodes only ever see complete
+def write_atomically(path, text):
+    temp_path = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.rename(temp_path, path)
+
+
+# Function to list the lease files in some of the queue's directories, directory by directory in
+# lease order (leaving out unfinished writes)
+def lease_files(queue_dir, *names):
+    return [
+        os.path.join(queue_dir, name, file_name)
+        for name in names
+        for file_name in sorted(os.listdir(os.path.join(queue_dir, name)))
+        if file_name.endswith(".json")
+    ]
+
+
+# Function to get the lease id a lease or results file belongs to ("00000042.worker.json" -> "00000042")
+def lease_id_of(path):
+    return os.path.basename(path).split(".", 1)[0]
+
+
+# Function to split a corpus of (id, question, answer) items into leases of lease_size questions
+def enqueue(queue_dir, items, lease_size):
+    open_queue(queue_dir)
+    # Number after the leases already queued, so a second enqueue adds to the queue
+    first = max((int(lease_id_of(path)) for path in lease_files(queue_dir, "pending", "claimed", "done")), default=0) + 1
+    leases = [items[start:start + lease_size] for start in range(0, len(items), lease_size)]
+    for lease_number, lease in enumerate(leases, first):
+        write_atomically(os.path.join(queue_dir, "pending", f"{lease_number:08d}.json"), json.dumps(lease))
+    return len(leases)
+
+
+# Function to claim the next pending lease, or one whose worker stopped sending heartbeats.
+# Returns (lease_id, path of the claimed lease file), or None when there is nothing left to claim.
+def claim_lease(queue_dir, worker, lease_timeout):
+    # Of several workers renaming the same file, exactly one succeeds; the others get FileNotFoundError
+    for path in lease_files(queue_dir, "pending", "claimed"):
+        lease_id = lease_id_of(path)
+        claimed_path = os.path.join(queue_dir, "claimed", f"{lease_id}.{worker}.json")
+        try:
+            if os.path.dirname(path).endswith("claimed"):
+                # The heartbeat is the claimed file's modification time
+                if time.time() - os.stat(path).st_mtime < lease_timeout:
+                    continue
+            os.rename(path, claimed_path)
+            # A rename keeps the old modification time, so renew it before another worker sees it as stale
+            os.utime(claimed_path)
+        except FileNotFoundError:
+            continue
+        return lease_id, claimed_path
+    return None
+
+
+# Function to read the result records in one results file, skipping a line cut short by a crash
+def read_results(path):
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+# Function to process one lease, skipping questions a previous holder of the lease already finished.
+# Returns False if another worker took the lease over in the meantime.
+def process_lease(queue_dir, worker, lease_id, claimed_path):
+    with open(claimed_path, encoding="utf-8") as f:
+        items = json.load(f)
+    done = {record["id"] for path in glob.glob(os.path.join(queue_dir, "results", f"{lease_id}.*.jsonl"))
+            for record in read_results(path)}
+    with open(os.path.join(queue_dir, "results", f"{lease_id}.{worker}.jsonl"), "a", encoding="utf-8") as results:
+        for position, (qid, question, answer) in enumerate(items):
+            # Ids that went through the JSON lease as numbers are compared as text
+            qid = str(qid)
+            if qid in done:
+                continue
+            model_output = answer
+            try:
+                if model_output is None:
+                    model_output = QueryModel(question)
+                verdict = str(process_question_and_answer(question, model_output))
+            except Exception as e:
+                # One bad question must not stop the worker, and then every worker the lease is handed to
+                verdict = f"Error: {type(e).__name__}: {e}"
+            results.write(json.dumps({"id": qid, "lease": lease_id, "position": position, "question": question,
+                                      "answer": model_output, "result": verdict, "worker": worker}) + "\n")
+            # Make the result visible to a worker that takes the lease over
+            results.flush()
+            os.fsync(results.fileno())
+            # Each finished question also renews the lease
+            try:
+                os.utime(claimed_path)
+            except FileNotFoundError:
+                return False
+    try:
+        os.rename(claimed_path, os.path.join(queue_dir, "done", f"{lease_id}.json"))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+# Function to keep claiming and processing leases until the queue is empty
+def work(queue_dir, worker, lease_timeout):
+    open_queue(queue_dir)
+    processed = 0
+    while True:
+        lease = claim_lease(queue_dir, worker, lease_timeout)
+        if lease is None:
+            break
+        lease_id, claimed_path = lease
+        print(f"Worker {worker}: processing lease {lease_id}")
+        if process_lease(queue_dir, worker, lease_id, claimed_path):
+            processed += 1
+        else:
+            print(f"Worker {worker}: lease {lease_id} was taken over by another worker")
+    return processed
+
+
+# Function to write every result, in corpus order, to a JSON lines file
+def merge(queue_dir, output_path):
+    open_queue(queue_dir)
+    remaining = len(lease_files(queue_dir, "pending", "claimed"))
+    results = {}
+    for path in sorted(glob.glob(os.path.join(queue_dir, "results", "*.jsonl"))):
+        for record in read_results(path):
+            # A question finished just as its lease was taken over can appear twice; keep one
+            results[record["id"]] = record
+    with open(output_path, "w", encoding="utf-8") as f:
+        for record in sorted(results.values(), key=lambda record: (record["lease"], record["position"])):
+            f.write(json.dumps({"id": record["id"], "question": record["question"], "answer": record["answer"],
+                                "result": record["result"], "worker": record["worker"]}) + "\n")
+    return len(results), remaining
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a question corpus on several nodes through a shared queue")
+    parser.add_argument("queue", help="lease directory on storage shared by every node (e.g. NFS)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="split a corpus into leases")
+    enqueue_parser.add_argument("corpus", nargs="?", help="JSON lines corpus (defaults to the built-in questions)")
+    enqueue_parser.add_argument("--lease-size", type=int, default=100)
+
+    work_parser = commands.add_parser("work", help="claim and process leases until none are left")
+    # Worker ids become part of file names
+    work_parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    work_parser.add_argument("--lease-timeout", type=float, default=3600,
+                             help="seconds without progress after which a lease is given to another worker")
+    add_lookup_arguments(work_parser)
+
+    merge_parser = commands.add_parser("merge", help="write all results to a JSON lines file")
+    merge_parser.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        corpus = load_corpus(args.corpus) if args.corpus else default_corpus()
+        count = enqueue(args.queue, corpus, args.lease_size)
+        print(f"Queued {len(corpus)} questions in {count} leases")
+    elif args.command == "work":
+        enable_lookups(args)
+        processed = work(args.queue, args.worker_id.replace(os.sep, "_"), args.lease_timeout)
+        print(f"Worker {args.worker_id}: finished {processed} leases")
+    else:
+        count, remaining = merge(args.queue, args.output)
+        print(f"Merged {count} results into {args.output} ({remaining} leases not finished)")
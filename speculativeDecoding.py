@@ -0,0 +1,24 @@
+import numpy as np
+from llama_cpp.llama_speculative import LlamaDraftModel
+
+
+# Draft model that lets a small Llama propose tokens for a larger one.
+# Both Llama 2 models share the same tokenizer, so the token ids line up.
+# The large model checks all proposed tokens in one forward pass and keeps
+# the ones it agrees with, so the output is the same as running it alone.
+class SmallModelDraft(LlamaDraftModel):
+    def __init__(self, draft_llm, num_pred_tokens=8):
+        self.draft_llm = draft_llm
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft_tokens = []
+        eos = self.draft_llm.token_eos()
+        # reset=True reuses the draft model's cached prefix, so only new tokens are evaluated
+        for token in self.draft_llm.generate(input_ids.tolist(), top_k=1, temp=0.0, reset=True):
+            if token == eos:
+                break
+            draft_tokens.append(token)
+            if len(draft_tokens) >= self.num_pred_tokens:
+                break
+        return np.array(draft_tokens, dtype=np.intc)
@@ -1,4 +1,5 @@
 from llama_cpp import Llama
+from hostProfile import load_host_profile
 import spacy
 import re
 
@@ -6,7 +7,7 @@ import re
 model_path = "/Users/project/WebdataProvessing/models/llama-2-7b.Q4_K_M.gguf"
 
 # Initialize the Llama model
-llm = Llama(model_path=model_path, verbose=False)
+llm = Llama(model_path=model_path, verbose=False, **load_host_profile(model_path))
 
 # Load spaCy English model
 nlp = spacy.load("en_core_web_sm")
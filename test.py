@@ -1,4 +1,5 @@
 from llama_cpp import Llama
+from hostProfile import load_host_profile
 import spacy
 import wikipedia
 from wikipedia.exceptions import DisambiguationError
@@ -8,7 +9,7 @@ import requests
 
 # Initialize the Llama model
 model_path = "/Users/project/WebdataProvessing/models/llama-2-7b.Q4_K_M.gguf"
-llm = Llama(model_path=model_path, verbose=False)
+llm = Llama(model_path=model_path, verbose=False, **load_host_profile(model_path))
 
 # Initialize spaCy for entity extraction
 nlp = spacy.load("en_core_web_sm")
@@ -24,11 +25,13 @@ def query_model(question):
     return output['choices'][0]['text']
 
 # Function to extract entities using spaCy
-def extract_entities(text):
+# With a title_index (see titleIndex.py) each entity links to its canonical article
+def extract_entities(text, title_index=None):
     doc = nlp(text)
     entities = {}
     for ent in doc.ents:
-        entities[ent.text] = f"https://en.wikipedia.org/wiki/{ent.text.replace(' ', '_')}"
+        url = title_index.url(ent.text) if title_index is not None else None
+        entities[ent.text] = url or f"https://en.wikipedia.org/wiki/{ent.text.replace(' ', '_')}"
     return entities
 
 # Function to determine the answer (yes/no or Wikipedia entity)
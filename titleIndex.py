@@ -0,0 +1,162 @@
+import argparse
+import mmap
+import os
+from array import array
+
+import finalTask
+
+# Redirect chains longer than this are treated as broken
+MAX_REDIRECT_DEPTH = 5
+
+
+# Function to put a title in Wikipedia's form: spaces instead of underscores, first letter upper case
+def normalize_title(title):
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+# Function to build the Wikipedia URL of a title
+def wikipedia_url(title):
+    return f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
+
+
+# Function to read a titles dump (one title per line, e.g. enwiki-latest-all-titles-in-ns0)
+def read_titles(titles_path):
+    with open(titles_path, encoding="utf-8") as f:
+        for line in f:
+            title = line.rstrip("\n")
+            if title and title != "page_title":
+                yield normalize_title(title)
+
+
+# Function to read redirects as "source<TAB>target" lines (e.g. exported from the redirect and page tables)
+def read_redirects(redirects_path):
+    redirects = {}
+    with open(redirects_path, encoding="utf-8") as f:
+        for line in f:
+            source, _, target = line.rstrip("\n").partition("\t")
+            if source and target:
+                redirects[normalize_title(source)] = normalize_title(target)
+    return redirects
+
+
+# Function to follow a redirect chain to the article it ends on (None if that article does not exist)
+def resolve_redirect(title, redirects, articles):
+    for _ in range(MAX_REDIRECT_DEPTH):
+        if title not in redirects:
+            return title if title in articles else None
+        title = redirects[title]
+    return None
+
+
+# Function to build the index files: base.data holds sorted "key<TAB>title<TAB>canonical" lines,
+# base.offsets the start of each line, so lookups can binary search the memory-mapped data
+def build_title_index(titles_path, redirects_path, base_path):
+    redirects = read_redirects(redirects_path) if redirects_path else {}
+    articles = set(read_titles(titles_path))
+    records = []
+    for title in articles | set(redirects):
+        canonical = resolve_redirect(title, redirects, articles)
+        if canonical:
+            records.append((title.casefold().encode("utf-8"), title, canonical))
+    # Sorted by the UTF-8 key bytes, the same order the lookups compare in
+    records.sort()
+
+    offsets = array("Q")
+    position = 0
+    with open(f"{base_path}.data", "wb") as data:
+        for key, title, canonical in records:
+            record = b"\t".join([key, title.encode("utf-8"), canonical.encode("utf-8")]) + b"\n"
+            offsets.append(position)
+            data.write(record)
+            position += len(record)
+    offsets.append(position)
+    with open(f"{base_path}.offsets", "wb") as f:
+        offsets.tofile(f)
+    return len(records)
+
+
+# Sorted, memory-mapped index of Wikipedia titles with case-folded keys
+class TitleIndex:
+    def __init__(self, base_path):
+        self._data_file = open(f"{base_path}.data", "rb")
+        self._offsets_file = open(f"{base_path}.offsets", "rb")
+        # An index built from an empty dump has no data, and empty files cannot be mapped
+        if os.path.getsize(f"{base_path}.data"):
+            self.data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = b""
+        self.offsets = memoryview(mmap.mmap(self._offsets_file.fileno(), 0, access=mmap.ACCESS_READ)).cast("Q")
+        self.size = len(self.offsets) - 1
+
+    def record(self, i):
+        key, title, canonical = self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8").rstrip("\n").split("\t")
+        return key, title, canonical
+
+    def key(self, i):
+        start = self.offsets[i]
+        return self.data[start:self.data.find(b"\t", start)]
+
+    # Function to find the first record whose key is not smaller than key (O(log n))
+    def lower_bound(self, key):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Function to get the canonical title for a title, following redirects and ignoring case
+    def lookup(self, title):
+        title = normalize_title(title)
+        key = title.casefold().encode("utf-8")
+        matches = []
+        i = self.lower_bound(key)
+        while i < self.size and self.key(i) == key:
+            matches.append(self.record(i))
+            i += 1
+        if not matches:
+            return None
+        # Several titles can differ only by case; prefer the exact one, then an article over a redirect
+        for _, candidate, canonical in matches:
+            if candidate == title:
+                return canonical
+        for _, candidate, canonical in matches:
+            if candidate == canonical:
+                return canonical
+        return matches[0][2]
+
+    # Function to list (title, canonical title) pairs whose title starts with prefix, ignoring case
+    def prefix(self, prefix, limit=10):
+        key = normalize_title(prefix).casefold().encode("utf-8")
+        results = []
+        i = self.lower_bound(key)
+        while i < self.size and len(results) < limit and self.key(i).startswith(key):
+            _, title, canonical = self.record(i)
+            results.append((title, canonical))
+            i += 1
+        return results
+
+    # Function to get the URL of the article a title resolves to, or None if no such title exists
+    def url(self, title):
+        canonical = self.lookup(title)
+        return wikipedia_url(canonical) if canonical else None
+
+
+# Function to make the URL emitters in finalTask resolve entities through an index
+def enable_title_index(base_path):
+    finalTask.title_index = TitleIndex(base_path)
+    return finalTask.title_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a memory-mapped Wikipedia title and redirect index")
+    parser.add_argument("titles", help="titles dump, one title per line")
+    parser.add_argument("index", help="output path prefix (writes .data and .offsets)")
+    parser.add_argument("--redirects", help="redirects as source<TAB>target lines")
+    args = parser.parse_args()
+
+    count = build_title_index(args.titles, args.redirects, args.index)
+    print(f"Indexed {count} titles into {args.index}.data")
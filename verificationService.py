@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import finalTask
+from finalTask import QueryModel, load_model, nlp, normalize_answer, process_question_and_answer
+from runJournal import add_lookup_arguments, enable_lookups
+
+
+# Groups concurrent requests into batches, waiting at most max_wait seconds for a batch to fill
+class MicroBatcher:
+    def __init__(self, handle_batch, max_batch_size=8, max_wait=0.02):
+        self.handle_batch = handle_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        # One thread per batcher: the model is not safe to call from several threads at once
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.handle_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            # handle_batch returns the exception in place of the result of an item that failed,
+            # so one bad item does not fail the other requests of its batch
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+# Function to answer a batch of questions, asking the model once per distinct question
+def ask_batch(questions):
+    answers = {}
+    for question in questions:
+        if question not in answers:
+            try:
+                answers[question] = QueryModel(question)
+            except Exception as e:
+                answers[question] = e
+    return [answers[question] for question in questions]
+
+
+# Wikidata lookups are network bound, so a batch is verified concurrently
+lookup_pool = ThreadPoolExecutor(max_workers=8)
+
+# Function to verify one parsed pair, returning the exception instead of raising it (e.g. a Wikidata timeout)
+def verify_pair(pair):
+    try:
+        return process_question_and_answer(*pair)
+    except Exception as e:
+        return e
+
+# Function to verify a batch of (question, answer) pairs, looking up each distinct pair once
+def verify_batch(pairs):
+    unique_pairs = list(dict.fromkeys(pairs))
+    # Parse the whole batch here, on the batcher's single thread: the spaCy pipeline is shared,
+    # and the lookup threads below only read the parsed Docs
+    docs = iter(nlp.pipe([text for pair in unique_pairs for text in pair]))
+    parsed_pairs = [(question, answer) for question, answer in zip(docs, docs)]
+    # Embed and search all the answers of the batch at once instead of one by one
+    if finalTask.semantic_matcher is not None:
+        try:
+            finalTask.semantic_matcher.prefetch([normalize_answer(answer) for _, answer in parsed_pairs])
+        except Exception as e:
+            # Only an optimisation: each answer is embedded on its own when it is matched
+            print(f"Could not prefetch answer embeddings: {e}")
+    verdicts = dict(zip(unique_pairs, lookup_pool.map(verify_pair, parsed_pairs)))
+    return [verdicts[pair] for pair in pairs]
+
+
+# Function to get a text field of a request, rejecting it before it reaches a batch shared with other clients
+def check_text(payload, field, required=True):
+    if not isinstance(payload, dict):
+        raise ValueError("the request body must be a JSON object")
+    value = payload.get(field)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field!r} must be a string")
+    return value
+
+
+class VerificationService:
+    def __init__(self, max_batch_size=8, max_wait=0.02):
+        self.ask_batcher = MicroBatcher(ask_batch, max_batch_size, max_wait)
+        self.verify_batcher = MicroBatcher(verify_batch, max_batch_size, max_wait)
+
+    async def ask(self, payload):
+        question = check_text(payload, "question")
+        answer = await self.ask_batcher.submit(question)
+        return {"question": question, "answer": answer}
+
+    async def verify(self, payload):
+        question = check_text(payload, "question")
+        answer = check_text(payload, "answer", required=False)
+        # Without an answer the model is asked first, as in the scripts
+        if answer is None:
+            answer = await self.ask_batcher.submit(question)
+        result = await self.verify_batcher.submit((question, answer))
+        return {"question": question, "answer": answer, "result": result}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            routes = {"/ask": self.ask, "/verify": self.verify}
+            if len(request_line) < 2 or request_line[0] != "POST" or request_line[1] not in routes:
+                status, response = 404, {"error": "use POST /ask or POST /verify"}
+            else:
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                    if content_length < 0:
+                        raise ValueError(f"invalid Content-Length {content_length}")
+                    body = await reader.readexactly(content_length)
+                    payload = json.loads(body or b"{}")
+                    status, response = 200, await routes[request_line[1]](payload)
+                except (ValueError, KeyError) as e:
+                    status, response = 400, {"error": f"bad request: {e}"}
+                except Exception as e:
+                    status, response = 500, {"error": str(e)}
+
+            data = json.dumps(response).encode("utf-8")
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        # Keep references to the batcher tasks so they are not garbage collected while running
+        self.batcher_tasks = [
+            asyncio.create_task(self.ask_batcher.run()),
+            asyncio.create_task(self.verify_batcher.run()),
+        ]
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Verification service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident fact checking service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait", type=float, default=0.02, help="seconds to wait for a batch to fill")
+    add_lookup_arguments(parser)
+    args = parser.parse_args()
+
+    enable_lookups(args)
+
+    # Load the model up front so the first request does not pay for it
+    load_model()
+    service = VerificationService(args.max_batch_size, args.max_wait)
+    asyncio.run(service.serve(args.host, args.port))
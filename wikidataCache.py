@@ -0,0 +1,179 @@
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+
+import finalTask
+from finalTask import WikidataUnavailable, query_wikidata_entity, query_wikidata_property, question_to_property_map
+
+# wbgetentities accepts at most 50 ids per request
+REVISION_BATCH_SIZE = 50
+
+
+# Function to get the current revision id of each entity, asking Wikidata in batches
+def fetch_revisions(entity_ids):
+    entity_ids = list(entity_ids)
+    revisions = {}
+    for start in range(0, len(entity_ids), REVISION_BATCH_SIZE):
+        batch = entity_ids[start:start + REVISION_BATCH_SIZE]
+        try:
+            response = requests.get("https://www.wikidata.org/w/api.php", params={
+                "action": "wbgetentities",
+                "ids": "|".join(batch),
+                "props": "info",
+                "format": "json",
+            })
+        except requests.RequestException:
+            # Entities left out are treated as unrevised and checked again next time
+            continue
+        if response.status_code != 200:
+            continue
+        for entity_id, entity in response.json().get("entities", {}).items():
+            if "lastrevid" in entity:
+                revisions[entity_id] = entity["lastrevid"]
+    return revisions
+
+
+# Function to read the entity ids listed in a recent-changes file (any text containing Q-ids)
+def read_changed_entities(changes_path):
+    with open(changes_path, encoding="utf-8") as f:
+        return set(re.findall(r"\bQ\d+\b", f.read()))
+
+
+# SQLite cache of Wikidata facts that remembers the revision each entity was fetched at
+class WikidataFactCache:
+    def __init__(self, cache_path):
+        # The verification service looks facts up from several threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entities (
+                search TEXT PRIMARY KEY,
+                entity_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS facts (
+                entity_id TEXT NOT NULL,
+                property_id TEXT NOT NULL,
+                objects TEXT NOT NULL,
+                PRIMARY KEY (entity_id, property_id)
+            );
+            CREATE TABLE IF NOT EXISTS revisions (
+                entity_id TEXT PRIMARY KEY,
+                lastrevid INTEGER NOT NULL,
+                checked_at REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    # Function to resolve a subject name to its entity id, searching Wikidata only the first time
+    def entity_id(self, subject):
+        with self.lock:
+            row = self.conn.execute("SELECT entity_id FROM entities WHERE search = ?", (subject,)).fetchone()
+        if row:
+            return row[0]
+        entity_id = query_wikidata_entity(subject)
+        if entity_id:
+            with self.lock:
+                self.conn.execute("INSERT OR REPLACE INTO entities VALUES (?, ?)", (subject, entity_id))
+                self.conn.commit()
+        return entity_id
+
+    # Function to get the objects of (subject, predicate), fetching and caching them on a miss
+    def lookup(self, subject, predicate):
+        property_id = question_to_property_map.get(predicate)
+        if not property_id:
+            return None
+        entity_id = self.entity_id(subject)
+        if not entity_id:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT objects FROM facts WHERE entity_id = ? AND property_id = ?", (entity_id, property_id)
+            ).fetchone()
+            known_revision = self.conn.execute(
+                "SELECT 1 FROM revisions WHERE entity_id = ?", (entity_id,)
+            ).fetchone()
+        if row:
+            return json.loads(row[0])
+
+        # Record the revision before fetching, so an edit made in between is caught by the next revalidation
+        if not known_revision:
+            self.store_revisions(fetch_revisions([entity_id]))
+        objects = query_wikidata_property(entity_id, property_id)
+        if objects is None:
+            return None
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO facts VALUES (?, ?, ?)", (entity_id, property_id, json.dumps(objects)))
+            self.conn.commit()
+        return objects
+
+    def store_revisions(self, revisions):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO revisions VALUES (?, ?, ?)",
+                [(entity_id, lastrevid, now) for entity_id, lastrevid in revisions.items()],
+            )
+            self.conn.commit()
+
+    # Function to refresh only the cached entities that changed on Wikidata since they were fetched.
+    # changed_entities comes from a recent-changes file; without it Wikidata is asked for each lastrevid.
+    def revalidate(self, changed_entities=None):
+        with self.lock:
+            cached = dict(self.conn.execute("SELECT entity_id, lastrevid FROM revisions").fetchall())
+            # Facts cached while their revision could not be fetched; always refreshed until it can
+            unrevised = {row[0] for row in self.conn.execute(
+                "SELECT DISTINCT entity_id FROM facts WHERE entity_id NOT IN (SELECT entity_id FROM revisions)"
+            )}
+        if changed_entities is None:
+            current = fetch_revisions(set(cached) | unrevised)
+            changed = {entity_id for entity_id, lastrevid in current.items() if lastrevid != cached.get(entity_id)}
+        else:
+            changed = (set(changed_entities) & set(cached)) | unrevised
+            current = fetch_revisions(changed)
+
+        for entity_id in changed:
+            with self.lock:
+                properties = [row[0] for row in self.conn.execute(
+                    "SELECT property_id FROM facts WHERE entity_id = ?", (entity_id,)
+                )]
+            for property_id in properties:
+                try:
+                    objects = query_wikidata_property(entity_id, property_id)
+                except WikidataUnavailable:
+                    # Keep the old revision so the entity is retried next time
+                    current.pop(entity_id, None)
+                    continue
+                with self.lock:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO facts VALUES (?, ?, ?)", (entity_id, property_id, json.dumps(objects))
+                    )
+                    self.conn.commit()
+        self.store_revisions({entity_id: current[entity_id] for entity_id in changed if entity_id in current})
+        return changed
+
+
+# Function to make the pipeline in finalTask answer Wikidata lookups from a cache file
+def enable_cache(cache_path):
+    finalTask.wikidata_cache = WikidataFactCache(cache_path)
+    return finalTask.wikidata_cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh cached Wikidata facts whose entities changed")
+    parser.add_argument("cache", help="SQLite cache file")
+    parser.add_argument("--changes", help="recent-changes file listing changed entity ids")
+    parser.add_argument("--interval", type=float, help="repeat every INTERVAL seconds instead of running once")
+    args = parser.parse_args()
+
+    cache = WikidataFactCache(args.cache)
+    while True:
+        changed = cache.revalidate(read_changed_entities(args.changes) if args.changes else None)
+        print(f"Refreshed {len(changed)} changed entities: {', '.join(sorted(changed)) or '-'}")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,119 @@
+import argparse
+import gc
+import multiprocessing
+import os
+import queue
+
+import finalTask
+from finalTask import QueryModel, as_doc, extract_claim, load_model, process_question_and_answer
+from records import outcome_names, verdict_from_result
+from runJournal import default_corpus, load_corpus
+
+
+# Function to count the CPUs this process may run on
+def available_cpus():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+# Function to pick a default worker count: a few workers, each with several threads, decode faster than
+# one single-threaded worker per core, which mostly compete for memory bandwidth
+def default_workers():
+    return max(1, min(4, available_cpus()))
+
+
+# Function to read this process's shared and private memory (bytes) from /proc
+def memory_report():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+# Function run by each forked worker: the model and spaCy pipeline are inherited from the parent
+def worker(worker_id, items, results):
+    verdicts = []
+    error = None
+    try:
+        for qid, question, answer in items:
+            model_output = answer if answer is not None else QueryModel(question)
+            # Parsed once for both the verification and the claim of the record
+            question = as_doc(question)
+            result = process_question_and_answer(question, model_output)
+            verdicts.append(verdict_from_result(qid, extract_claim(question), model_output, result))
+    except Exception as e:
+        # Still report, with what was finished, so the parent never waits for a worker that gave up
+        error = f"{type(e).__name__}: {e}"
+    results.put((worker_id, verdicts, memory_report(), error))
+
+
+# Function to load the models once, then fork workers that share those pages copy-on-write
+def launch_workers(items, num_workers):
+    # Every worker inherits the model and its thread settings, so split the CPUs between the workers
+    # instead of letting each one start a thread per core
+    threads = max(1, available_cpus() // num_workers)
+    finalTask.model_overrides = {"n_threads": threads, "n_threads_batch": threads}
+    # Loaded before forking: the GGUF is mmap'd and spaCy is loaded when finalTask is imported
+    load_model()
+    # Move everything loaded so far out of the garbage collector's reach, so collections in the
+    # workers do not write to (and therefore copy) the shared pages
+    gc.freeze()
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [
+        context.Process(target=worker, args=(worker_id, items[worker_id::num_workers], results))
+        for worker_id in range(num_workers)
+    ]
+    for process in workers:
+        process.start()
+    reports = {}
+    exited = set()
+    while len(reports) < len(workers):
+        try:
+            worker_id, worker_verdicts, report, error = results.get(timeout=1)
+            reports[worker_id] = (worker_verdicts, report, error)
+        except queue.Empty:
+            # A worker killed outright (e.g. by the OOM killer) never reports. One that had already
+            # exited before this second of silence has nothing left in the queue, so stop waiting for it
+            for worker_id in exited - reports.keys():
+                reports[worker_id] = ([], None, f"exited with code {workers[worker_id].exitcode}")
+        exited = {worker_id for worker_id, process in enumerate(workers) if process.exitcode is not None}
+    for process in workers:
+        process.join()
+    for worker_id, (_, _, error) in sorted(reports.items()):
+        if error:
+            print(f"Worker {worker_id} failed: {error}")
+
+    parent = memory_report()
+    print(f"{'process':>10} {'rss MB':>10} {'pss MB':>10} {'shared MB':>10} {'private MB':>10}")
+    rows = [("parent", parent)] + [
+        (f"worker {worker_id}", report) for worker_id, (_, report, _) in sorted(reports.items()) if report
+    ]
+    for name, report in rows:
+        print(f"{name:>10} " + " ".join(f"{report[key] / 2**20:>10.1f}" for key in ("rss", "pss", "shared", "private")))
+
+    verdicts = [verdict for worker_verdicts, _, _ in reports.values() for verdict in worker_verdicts]
+    return verdicts, {name: report for name, report in rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline in forked workers sharing one loaded model")
+    parser.add_argument("corpus", nargs="?", help="JSON lines corpus (defaults to the built-in questions)")
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="worker processes; the CPUs are split evenly between them")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else default_corpus()
+    verdicts, _ = launch_workers(corpus, args.workers)
+    questions = {qid: question for qid, question, _ in corpus}
+    for verdict in verdicts:
+        print(f"Question: {questions[verdict.question_id]} -> Answer: {verdict.answer} "
+              f"-> Result: {outcome_names[verdict.outcome]}")